@@ -0,0 +1,106 @@
+"""
+Cache Helper Functions
+
+Redis helpers for caching serialized (JSON bytes) catalog responses, plus a small
+list-backed queue used to make background writes durable.
+Redis is optional: when REDIS_URL is not set (or Redis is unreachable) every helper
+is a no-op and callers fall through to MongoDB.
+"""
+
+import os
+import redis
+import redis.asyncio
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 300))
+
+_redis = None
+
+redis_url = os.getenv("REDIS_URL")
+
+if redis_url:
+    _redis = redis.asyncio.Redis.from_url(redis_url)
+
+async def cache_get(key: str):
+    """Return the cached bytes for key, or None on miss"""
+    if _redis is None:
+        return None
+    try:
+        val = await _redis.get(key)
+    except redis.RedisError:
+        return None
+    return val
+
+async def cache_set(key: str, value: bytes, ttl: int = CACHE_TTL_SECONDS):
+    """Store already-serialized bytes under key with a TTL"""
+    if _redis is None:
+        return
+    try:
+        await _redis.setex(key, ttl, value)
+    except redis.RedisError:
+        pass
+
+async def cache_invalidate(*patterns: str):
+    """Delete every key matching any of the given glob patterns"""
+    if _redis is None:
+        return
+    try:
+        for pattern in patterns:
+            keys = [key async for key in _redis.scan_iter(match=pattern)]
+            if keys:
+                await _redis.delete(*keys)
+    except redis.RedisError:
+        pass
+
+async def queue_push(name: str, payload: bytes) -> bool:
+    """LPUSH payload onto a list queue; returns False if it could not be queued"""
+    if _redis is None:
+        return False
+    try:
+        await _redis.lpush(name, payload)
+    except redis.RedisError:
+        return False
+    return True
+
+async def queue_claim(name: str, processing: str):
+    """Atomically move the oldest payload from name onto processing, or None when empty.
+
+    The payload stays in Redis until queue_remove acknowledges it, so a failed consumer
+    loses nothing. Uses LMOVE, which needs Redis 6.2 or newer.
+    """
+    if _redis is None:
+        return None
+    try:
+        return await _redis.lmove(name, processing, "RIGHT", "LEFT")
+    except redis.RedisError:
+        return None
+
+async def queue_peek(name: str):
+    """Return the oldest payload on a list queue without removing it, or None when empty"""
+    if _redis is None:
+        return None
+    try:
+        return await _redis.lindex(name, -1)
+    except redis.RedisError:
+        return None
+
+async def queue_items(name: str) -> list:
+    """Return every payload currently on a list queue without removing them"""
+    if _redis is None:
+        return []
+    try:
+        return await _redis.lrange(name, 0, -1)
+    except redis.RedisError:
+        return []
+
+async def queue_remove(name: str, payload: bytes):
+    """Acknowledge a processed payload by removing it from the queue"""
+    if _redis is None:
+        return
+    try:
+        await _redis.lrem(name, 1, payload)
+    except redis.RedisError:
+        pass
@@ -1,14 +1,86 @@
+import asyncio
+import hashlib
+import logging
 import os
-from fastapi import FastAPI, HTTPException
+import re
+import time
+import orjson
+from bson import ObjectId
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from database import db, create_document, get_documents
+from database import db, create_documents
+from cache import cache_get, cache_set, cache_invalidate, queue_push, queue_claim, queue_peek, queue_items, queue_remove
 from schemas import Product, Category, Cart, CartItem, Order, OrderItem, Customer
 
-app = FastAPI(title="Department Store E‑commerce API")
+UTC = timezone.utc
+
+logger = logging.getLogger(__name__)
+
+
+def _orjson_default(obj):
+    # orjson handles datetime natively; Mongo ids are the only extra type we emit
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError
+
+
+def dump_json(content) -> bytes:
+    return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also serializes ObjectId; return raw Mongo documents through it."""
+
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+
+# blake2b digest_size=8 -> 16 hex chars, stored in front of the cached body
+ETAG_HEX_LEN = 16
+
+# Bumped whenever the cached value format changes so old entries are never misread;
+# cat:*/prod:* invalidation still covers every version
+CACHE_KEY_VERSION = "v2"
+
+
+def make_etag(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=ETAG_HEX_LEN // 2).hexdigest()
+
+
+async def cache_get_tagged(key: str):
+    """Return (etag, body) for a cached catalog response, or None on miss"""
+    cached = await cache_get(key)
+    if cached is None:
+        return None
+    return cached[:ETAG_HEX_LEN].decode(), cached[ETAG_HEX_LEN:]
+
+
+async def cache_set_tagged(key: str, body: bytes) -> str:
+    """Cache body together with its etag so hits need neither encoding nor hashing"""
+    etag = make_etag(body)
+    await cache_set(key, etag.encode() + body)
+    return etag
+
+
+def etag_response(request: Request, body: bytes, etag: str) -> Response:
+    # body is already encoded (fresh or from cache); skip re-serialization
+    headers = {"ETag": f'"{etag}"'}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # weak comparison (RFC 9110): proxies and gzip layers may have added W/
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if "*" in tags or headers["ETag"] in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+app = FastAPI(title="Department Store E‑commerce API", default_response_class=MongoJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,13 +91,236 @@ app.add_middleware(
 )
 
 
+# Set at startup; without the text index every search uses the search_blob substring match
+text_search_enabled = False
+
+
+# Internal search fields, never part of a product response
+SEARCH_FIELDS_HIDDEN = {"title_lower": 0, "search_blob": 0}
+
+
+def with_search_fields(product: dict) -> dict:
+    """Return a copy of product with the denormalized lowercase search fields set"""
+    title = product.get("title", "")
+    return {
+        **product,
+        "title_lower": title.lower(),
+        "search_blob": (title + " " + (product.get("description") or "")).lower(),
+    }
+
+
+async def _dedupe_carts():
+    """Keep only the most recently updated cart per session_id.
+
+    The old find-then-insert cart write could race and leave duplicates, which would
+    make the unique session_id index fail to build.
+    """
+    pipeline = [
+        {"$sort": {"updated_at": -1}},
+        {"$group": {"_id": "$session_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    async for group in db["cart"].aggregate(pipeline):
+        stale = group["ids"][1:]
+        await db["cart"].delete_many({"_id": {"$in": stale}})
+        logger.warning("Removed %d duplicate cart(s) for session %s", len(stale), group["_id"])
+
+
+async def _backfill_search_fields():
+    """Set title_lower/search_blob on products written before those fields existed"""
+    # same values as with_search_fields, computed server-side in one update
+    title = {"$ifNull": ["$title", ""]}
+    result = await db["product"].update_many(
+        {"search_blob": {"$exists": False}},
+        [{"$set": {
+            "title_lower": {"$toLower": title},
+            "search_blob": {"$toLower": {"$concat": [title, " ", {"$ifNull": ["$description", ""]}]}},
+        }}]
+    )
+    if result.modified_count:
+        logger.info("Backfilled search fields on %d product(s)", result.modified_count)
+
+
+DUPLICATE_KEY_CODE = 11000
+
+
+async def _create_index(collection: str, keys, **kwargs) -> bool:
+    """Build one index, logging instead of raising so one failure can't skip the rest"""
+    try:
+        await db[collection].create_index(keys, **kwargs)
+    except PyMongoError:
+        logger.exception("Could not create index %s on %s", keys, collection)
+        return False
+    return True
+
+
+async def _ensure_cart_session_index():
+    # the unique index is what makes the cart upsert safe; dedupe only if it can't be built
+    try:
+        await db["cart"].create_index("session_id", unique=True)
+        return
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY_CODE:
+            logger.exception("Could not create unique index on cart.session_id")
+            return
+    except PyMongoError:
+        logger.exception("Could not create unique index on cart.session_id")
+        return
+    try:
+        await _dedupe_carts()
+    except PyMongoError:
+        logger.exception("Could not remove duplicate carts; cart.session_id stays non-unique")
+        return
+    await _create_index("cart", "session_id", unique=True)
+
+
+@app.on_event("startup")
+async def ensure_indexes():
+    global text_search_enabled
+    if db is None:
+        return
+    # index setup must never keep the API from starting; /test and /readyz report the database
+    try:
+        await db.command("ping")
+    except PyMongoError:
+        logger.exception("MongoDB unreachable; starting without index setup")
+        return
+    # full-text index backing the /products?q= search
+    try:
+        await db["product"].create_index([("title", "text"), ("description", "text")])
+        text_search_enabled = True
+    except OperationFailure:
+        # the server refused the index (e.g. text indexes unsupported): use the regex fallback
+        logger.warning("Text index unavailable; /products?q= falls back to search_blob regex")
+        text_search_enabled = False
+    except PyMongoError:
+        logger.exception("Could not create the product text index")
+    await _create_index("product", "search_blob")
+    # the substring fallback serves every query the text index can't match
+    try:
+        await _backfill_search_fields()
+    except PyMongoError:
+        logger.exception("Could not backfill product search fields")
+    # equality lookups used by the catalog, cart and checkout endpoints
+    await _create_index("product", "category_slug")
+    await _create_index("category", "slug", unique=True)
+    await _ensure_cart_session_index()
+    await _create_index("order", "session_id")
+
+
+async def drain_pending_orders():
+    """One pass over the order queues: write every entry a checkout left unpersisted"""
+    # claimed by a drain that died or failed before acknowledging; replaying is safe
+    # because orders are inserted under their pre-assigned _id
+    for raw in await queue_items(PROCESSING_ORDERS_QUEUE):
+        if not await _replay_pending_order(raw):
+            return
+    # leave recent entries to the worker whose background task is still writing them
+    while (raw := await queue_peek(PENDING_ORDERS_QUEUE)) is not None:
+        if time.time() - _queued_at(raw) < PENDING_ORDER_GRACE_SECONDS:
+            return
+        raw = await queue_claim(PENDING_ORDERS_QUEUE, PROCESSING_ORDERS_QUEUE)
+        if raw is None or not await _replay_pending_order(raw):
+            return
+
+
+async def _drain_pending_orders_forever():
+    while True:
+        try:
+            await drain_pending_orders()
+        except Exception:
+            logger.exception("Pending order drain failed; retrying next interval")
+        await asyncio.sleep(PENDING_ORDER_DRAIN_INTERVAL_SECONDS)
+
+
+_drain_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_order_drain():
+    # background writes that failed at runtime are retried here, not only at the next restart
+    global _drain_task
+    if db is None:
+        return
+    _drain_task = asyncio.create_task(_drain_pending_orders_forever())
+
+
+@app.on_event("shutdown")
+async def stop_order_drain():
+    if _drain_task is not None:
+        _drain_task.cancel()
+
+
+def _queued_at(raw: bytes) -> float:
+    try:
+        return float(orjson.loads(raw).get("queued_at", 0))
+    except (ValueError, TypeError, AttributeError):
+        return 0.0  # unreadable entries are old enough; _replay_pending_order drops them
+
+
+async def _replay_pending_order(raw: bytes) -> bool:
+    """Persist one claimed queue entry; acknowledge it only once the write succeeded"""
+    try:
+        entry = orjson.loads(raw)
+        order_doc = _order_from_queue(entry["order"])
+    except (ValueError, KeyError, TypeError):
+        logger.error("Dropping unreadable pending order entry: %r", raw[:200])
+        await queue_remove(PROCESSING_ORDERS_QUEUE, raw)
+        return True
+    try:
+        await _persist_order(order_doc)
+    except PyMongoError:
+        # left on the processing list, so the next drain pass retries it
+        logger.exception("Could not persist pending order %s; will retry", order_doc["_id"])
+        return False
+    await queue_remove(PROCESSING_ORDERS_QUEUE, raw)
+    return True
+
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Department Store API is running"}
 
 
+# Static parts of the /test report, resolved once at import
+DATABASE_INFO = {
+    "database_url": "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set",
+    "database_name": (getattr(db, 'name', None) or "unknown") if db is not None else None,
+}
+
+COLLECTIONS_TTL_SECONDS = 30
+_collections_cache = {"expires_at": 0.0, "names": []}
+
+
+async def _cached_collection_names() -> List[str]:
+    # listCollections is a server round-trip; probes may hit /test every few seconds
+    now = time.monotonic()
+    if now >= _collections_cache["expires_at"]:
+        _collections_cache["names"] = await db.list_collection_names()
+        _collections_cache["expires_at"] = now + COLLECTIONS_TTL_SECONDS
+    return _collections_cache["names"]
+
+
+@app.get("/healthz")
+async def healthz():
+    # liveness: process is up, no database round-trip
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # readiness: a ping is the cheapest command that proves the database answers
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database not configured")
+    try:
+        await db.command("ping")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e)[:50])
+    return {"status": "ok"}
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -37,11 +332,10 @@ def test_database():
     try:
         if db is not None:
             response["database"] = "✅ Available"
-            response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-            response["database_name"] = getattr(db, 'name', None) or "unknown"
+            response.update(DATABASE_INFO)
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await _cached_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -53,61 +347,65 @@ def test_database():
     return response
 
 
+# Seed data, built once at import
+SEED_CATEGORIES = [
+    {"name": "Electronics", "slug": "electronics", "image": "https://images.unsplash.com/photo-1518779578993-ec3579fee39f"},
+    {"name": "Home & Kitchen", "slug": "home-kitchen", "image": "https://images.unsplash.com/photo-1495546968767-f0573cca821e"},
+    {"name": "Beauty", "slug": "beauty", "image": "https://images.unsplash.com/photo-1512496015851-a90fb38ba796"},
+    {"name": "Clothing", "slug": "clothing", "image": "https://images.unsplash.com/photo-1520975916090-3105956dac38"}
+]
+
+SEED_PRODUCTS = [
+    {
+        "title": "Wireless Headphones",
+        "description": "Noise-cancelling over-ear headphones",
+        "price": 129.99,
+        "compare_at_price": 179.99,
+        "category_slug": "electronics",
+        "brand": "SoundMax",
+        "sku": "HD-1001",
+        "images": ["https://images.unsplash.com/photo-1512314889357-e157c22f938d"],
+        "rating": 4.6,
+        "stock": 25,
+        "attributes": {"color": "black"}
+    },
+    {
+        "title": "Stainless Cookware Set",
+        "description": "10-piece pots and pans set",
+        "price": 89.0,
+        "category_slug": "home-kitchen",
+        "brand": "ChefPro",
+        "sku": "CK-2002",
+        "images": ["https://images.unsplash.com/photo-1514517220039-39c7b53c0b18"],
+        "rating": 4.4,
+        "stock": 40,
+        "attributes": {"pieces": "10"}
+    },
+    {
+        "title": "Organic Face Serum",
+        "description": "Vitamin C brightening serum",
+        "price": 24.5,
+        "category_slug": "beauty",
+        "brand": "GlowLab",
+        "sku": "GL-3003",
+        "images": ["https://images.unsplash.com/photo-1611930022073-b7a4ba5fcccd"],
+        "rating": 4.7,
+        "stock": 60,
+        "attributes": {"size": "30ml"}
+    }
+]
+
+
 # Seed minimal data if empty
 @app.post("/seed")
-def seed():
-    try:
-        if db["category"].count_documents({}) == 0:
-            categories = [
-                {"name": "Electronics", "slug": "electronics", "image": "https://images.unsplash.com/photo-1518779578993-ec3579fee39f"},
-                {"name": "Home & Kitchen", "slug": "home-kitchen", "image": "https://images.unsplash.com/photo-1495546968767-f0573cca821e"},
-                {"name": "Beauty", "slug": "beauty", "image": "https://images.unsplash.com/photo-1512496015851-a90fb38ba796"},
-                {"name": "Clothing", "slug": "clothing", "image": "https://images.unsplash.com/photo-1520975916090-3105956dac38"}
-            ]
-            for c in categories:
-                create_document("category", c)
-        if db["product"].count_documents({}) == 0:
-            sample = [
-                {
-                    "title": "Wireless Headphones",
-                    "description": "Noise-cancelling over-ear headphones",
-                    "price": 129.99,
-                    "compare_at_price": 179.99,
-                    "category_slug": "electronics",
-                    "brand": "SoundMax",
-                    "sku": "HD-1001",
-                    "images": ["https://images.unsplash.com/photo-1512314889357-e157c22f938d"],
-                    "rating": 4.6,
-                    "stock": 25,
-                    "attributes": {"color": "black"}
-                },
-                {
-                    "title": "Stainless Cookware Set",
-                    "description": "10-piece pots and pans set",
-                    "price": 89.0,
-                    "category_slug": "home-kitchen",
-                    "brand": "ChefPro",
-                    "sku": "CK-2002",
-                    "images": ["https://images.unsplash.com/photo-1514517220039-39c7b53c0b18"],
-                    "rating": 4.4,
-                    "stock": 40,
-                    "attributes": {"pieces": "10"}
-                },
-                {
-                    "title": "Organic Face Serum",
-                    "description": "Vitamin C brightening serum",
-                    "price": 24.5,
-                    "category_slug": "beauty",
-                    "brand": "GlowLab",
-                    "sku": "GL-3003",
-                    "images": ["https://images.unsplash.com/photo-1611930022073-b7a4ba5fcccd"],
-                    "rating": 4.7,
-                    "stock": 60,
-                    "attributes": {"size": "30ml"}
-                }
-            ]
-            for p in sample:
-                create_document("product", p)
+async def seed():
+    try:
+        if await db["category"].count_documents({}) == 0:
+            await create_documents("category", SEED_CATEGORIES)
+        if await db["product"].count_documents({}) == 0:
+            await create_documents("product", [with_search_fields(p) for p in SEED_PRODUCTS])
+        # catalog changed: drop cached listings and product lookups
+        await cache_invalidate("cat:*", "prod:*")
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -115,75 +413,129 @@ def seed():
 
 # Catalog endpoints
 @app.get("/categories")
-def list_categories():
+async def list_categories(request: Request):
     try:
-        cats = get_documents("category", {})
-        for c in cats:
-            c["_id"] = str(c["_id"])  # make JSON serializable
-        return cats
+        cache_key = f"cat:{CACHE_KEY_VERSION}:all"
+        cached = await cache_get_tagged(cache_key)
+        if cached is not None:
+            return etag_response(request, cached[1], cached[0])
+        # ids are stringified by the server, so documents come back JSON-ready
+        cursor = db["category"].aggregate([{"$addFields": {"_id": {"$toString": "$_id"}}}])
+        cats = await cursor.to_list(length=None)
+        body = dump_json(cats)
+        etag = await cache_set_tagged(cache_key, body)
+        return etag_response(request, body, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Fields needed to render a product tile; full documents come from /products/{id}
+PRODUCT_LIST_PROJECTION = {
+    "_id": {"$toString": "$_id"},
+    "title": 1,
+    "price": 1,
+    "compare_at_price": 1,
+    "category_slug": 1,
+    "images": {"$slice": ["$images", 1]},
+    "rating": 1,
+    "stock": 1,
+}
+
+
 @app.get("/products")
-def list_products(category: Optional[str] = None, q: Optional[str] = None):
+async def list_products(
+    request: Request,
+    category: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = Query(24, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
     try:
+        cache_key = f"prod:{CACHE_KEY_VERSION}:cat={category or ''}:q={q or ''}:limit={limit}:offset={offset}"
+        cached = await cache_get_tagged(cache_key)
+        if cached is not None:
+            return etag_response(request, cached[1], cached[0])
         filter_q = {}
         if category:
             filter_q["category_slug"] = category
-        products = get_documents("product", filter_q)
-        # simple search filter if q
+        sort = {"_id": 1}  # stable order for offset paging
         if q:
-            q_lower = q.lower()
-            products = [p for p in products if q_lower in p.get("title", "").lower() or q_lower in p.get("description", "").lower()]
-        for p in products:
-            p["_id"] = str(p["_id"])  # serialize
-        return products
+            # text first: whole-word, stemmed matches ranked by relevance. When the text
+            # index finds nothing (partial words like "phone", stop words), refine with a
+            # substring match on the pre-lowercased blob, so search never matches less than
+            # the old substring filter did. The choice is per query, so every page agrees.
+            text_q = {**filter_q, "$text": {"$search": q}}
+            if text_search_enabled and await db["product"].count_documents(text_q, limit=1):
+                filter_q = text_q
+                sort = {"score": {"$meta": "textScore"}}
+            else:
+                filter_q["search_blob"] = {"$regex": re.escape(q.lower())}
+        pipeline = [
+            {"$match": filter_q},
+            {"$sort": sort},
+            {"$skip": offset},
+            {"$limit": limit},
+            {"$project": PRODUCT_LIST_PROJECTION},
+        ]
+        # materialized on purpose: limit caps a page at 100 tile-sized documents, and a
+        # complete body is what lets the response carry an ETag and be cached
+        products = await db["product"].aggregate(pipeline).to_list(length=limit)
+        body = dump_json(products)
+        etag = await cache_set_tagged(cache_key, body)
+        return etag_response(request, body, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/products/{product_id}")
-def get_product(product_id: str):
-    from bson import ObjectId
+async def get_product(request: Request, product_id: str):
     try:
-        doc = db["product"].find_one({"_id": ObjectId(product_id)})
+        cache_key = f"prod:{CACHE_KEY_VERSION}:{product_id}"
+        cached = await cache_get_tagged(cache_key)
+        if cached is not None:
+            return etag_response(request, cached[1], cached[0])
+        doc = await db["product"].find_one({"_id": ObjectId(product_id)}, SEARCH_FIELDS_HIDDEN)
         if not doc:
             raise HTTPException(status_code=404, detail="Product not found")
-        doc["_id"] = str(doc["_id"])  # serialize
-        return doc
+        body = dump_json(doc)
+        etag = await cache_set_tagged(cache_key, body)
+        return etag_response(request, body, etag)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Cart endpoints (session-based simple cart)
 @app.post("/cart")
-def create_or_update_cart(cart: Cart):
+async def create_or_update_cart(cart: Cart):
     try:
         # Recalculate subtotal and timestamp
         subtotal = sum(item.price * item.quantity for item in cart.items)
-        data = cart.model_dump()
+        # JSON-native types, no None fields: smaller documents to write and decode
+        data = cart.model_dump(mode="json", exclude_none=True, exclude={"updated_at"})
         data["subtotal"] = round(subtotal, 2)
-        data["updated_at"] = datetime.now(timezone.utc)
+        now = datetime.now(UTC)
+        data["updated_at"] = now
 
-        existing = db["cart"].find_one({"session_id": cart.session_id})
-        if existing:
-            db["cart"].update_one({"_id": existing["_id"]}, {"$set": data})
-        else:
-            create_document("cart", data)
+        # single atomic round-trip; the unique session_id index prevents duplicate carts
+        await db["cart"].update_one(
+            {"session_id": cart.session_id},
+            {"$set": data, "$setOnInsert": {"created_at": now}},
+            upsert=True
+        )
         return {"status": "ok", "subtotal": data["subtotal"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/cart/{session_id}")
-def get_cart(session_id: str):
+async def get_cart(session_id: str):
     try:
-        cart = db["cart"].find_one({"session_id": session_id})
+        cart = await db["cart"].find_one({"session_id": session_id})
         if not cart:
             return {"session_id": session_id, "items": [], "subtotal": 0.0}
-        cart["_id"] = str(cart["_id"])  # serialize
-        return cart
+        return MongoJSONResponse(cart)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -194,37 +546,118 @@ class CheckoutPayload(BaseModel):
     customer: Customer
 
 
+# Validator for cart line items, compiled once instead of per checkout
+ORDER_ITEMS_ADAPTER = TypeAdapter(List[OrderItem])
+
+
+# Redis list holding checkouts accepted but not yet written to Mongo
+PENDING_ORDERS_QUEUE = "orders:pending"
+# entries claimed by drain_pending_orders, removed once the order is written
+PROCESSING_ORDERS_QUEUE = "orders:processing"
+# how often each worker drains the queues, and how old an entry must be before a drain
+# takes it over from the checkout's own background write
+PENDING_ORDER_DRAIN_INTERVAL_SECONDS = 30
+PENDING_ORDER_GRACE_SECONDS = 30
+
+ORDER_DATETIME_FIELDS = ("placed_at", "created_at", "updated_at")
+
+
+def _order_from_queue(order: dict) -> dict:
+    """Restore BSON types on an order document decoded from the pending queue"""
+    order["_id"] = ObjectId(order["_id"])
+    for field in ORDER_DATETIME_FIELDS:
+        if order.get(field):
+            order[field] = datetime.fromisoformat(order[field])
+    return order
+
+
+async def _persist_order(order_doc: dict, queued: Optional[bytes] = None):
+    try:
+        await db["order"].insert_one(order_doc)
+    except DuplicateKeyError:
+        pass  # already written, e.g. by drain_pending_orders
+    if queued is not None:
+        await queue_remove(PENDING_ORDERS_QUEUE, queued)
+
+
+async def _restore_cart(cart: dict):
+    """Put back a cart claimed by a checkout that did not go through"""
+    try:
+        await db["cart"].insert_one(cart)
+    except DuplicateKeyError:
+        pass  # the session already started a new cart; keep that one
+
+
+def _build_order(session_id: str, customer: Customer, cart: dict, products_by_id: dict) -> dict:
+    """Validate the cart against the catalog and return the order document to store"""
+    items = []
+    wanted = {}
+    for i in ORDER_ITEMS_ADAPTER.validate_python(cart["items"]):
+        product = products_by_id.get(i.product_id)
+        if product is None:
+            raise HTTPException(status_code=400, detail=f"Product no longer available: {i.product_id}")
+        wanted[i.product_id] = wanted.get(i.product_id, 0) + i.quantity
+        if wanted[i.product_id] > product.get("stock", 0):
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product['title']}")
+        # canonical catalog price and title, not the copy cached in the cart
+        items.append(i.model_copy(update={"price": float(product["price"]), "title": product["title"]}))
+    # recompute from line items in integer cents rather than trusting cart["subtotal"]
+    subtotal_c = sum(int(round(i.price * 100)) * i.quantity for i in items)
+    tax_c = (subtotal_c * 8 + 50) // 100  # 8% tax, rounded half up to the cent
+    total_c = subtotal_c + tax_c
+    order = Order.model_validate({
+        "session_id": session_id,
+        "customer": customer,
+        "items": items,
+        "subtotal": subtotal_c / 100,
+        "tax": tax_c / 100,
+        "total": total_c / 100
+    })
+    # the id is assigned up-front so the client gets it before the write happens
+    order_doc = order.model_dump(mode="json", exclude_none=True)
+    order_doc["_id"] = ObjectId()
+    now = datetime.now(UTC)
+    order_doc["placed_at"] = now
+    order_doc["created_at"] = now
+    order_doc["updated_at"] = now
+    return order_doc
+
+
 @app.post("/checkout")
-def checkout(payload: CheckoutPayload):
+async def checkout(payload: CheckoutPayload, background: BackgroundTasks):
     try:
-        cart = db["cart"].find_one({"session_id": payload.session_id})
-        if not cart or not cart.get("items"):
+        # claim the cart atomically so a double-submit can't place the same cart twice
+        cart = await db["cart"].find_one_and_delete({"session_id": payload.session_id})
+        if not cart:
             raise HTTPException(status_code=400, detail="Cart is empty")
-        items = [
-            OrderItem(
-                product_id=i["product_id"],
-                title=i["title"],
-                price=float(i["price"]),
-                quantity=int(i["quantity"]),
-                image=i.get("image")
-            ) for i in cart["items"]
-        ]
-        subtotal = float(cart.get("subtotal", 0.0))
-        tax = round(subtotal * 0.08, 2)
-        total = round(subtotal + tax, 2)
-        order = Order(
-            session_id=payload.session_id,
-            customer=payload.customer,
-            items=items,
-            subtotal=subtotal,
-            tax=tax,
-            total=total,
-            placed_at=datetime.now(timezone.utc)
-        )
-        order_id = create_document("order", order)
-        # clear cart
-        db["cart"].delete_one({"session_id": payload.session_id})
-        return {"status": "ok", "order_id": order_id, "total": total}
+        try:
+            if not cart.get("items"):
+                raise HTTPException(status_code=400, detail="Cart is empty")
+            product_ids = [i.get("product_id") for i in cart["items"]]
+            if not all(ObjectId.is_valid(pid) for pid in product_ids):
+                raise HTTPException(status_code=400, detail="Cart contains an invalid product id")
+            # one round-trip for every product in the cart instead of a lookup per line
+            cursor = db["product"].find(
+                {"_id": {"$in": list({ObjectId(pid) for pid in product_ids})}},
+                {"price": 1, "stock": 1, "title": 1}
+            )
+            products_by_id = {str(p["_id"]): p for p in await cursor.to_list(length=None)}
+            order_doc = _build_order(payload.session_id, payload.customer, cart, products_by_id)
+        except Exception:
+            await _restore_cart(cart)
+            raise
+        # the write may only move off the request path once the order is durably queued
+        queued = dump_json({"order": order_doc, "queued_at": time.time()})
+        if await queue_push(PENDING_ORDERS_QUEUE, queued):
+            background.add_task(_persist_order, order_doc, queued)
+        else:
+            # no Redis (the default) or Redis down: write inline, like the synchronous path
+            try:
+                await _persist_order(order_doc)
+            except Exception:
+                await _restore_cart(cart)
+                raise
+        return {"status": "ok", "order_id": str(order_doc["_id"]), "total": order_doc["total"]}
     except HTTPException:
         raise
     except Exception as e:
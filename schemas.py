@@ -4,12 +4,15 @@ Database Schemas for Department Store E‑commerce
 Each Pydantic model represents a MongoDB collection. The collection name is the lowercase
 of the class name (e.g., Product -> "product").
 """
-from __future__ import annotations
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from typing import List, Optional, Dict
 from datetime import datetime
 
 
+# Shared by the small models built many times per request (cart lines, order lines, customer)
+HOT_MODEL_CONFIG = ConfigDict(extra="forbid", frozen=True, str_strip_whitespace=True)
+
+
 class Category(BaseModel):
     name: str = Field(..., description="Category display name")
     slug: str = Field(..., description="URL-friendly unique slug")
@@ -33,6 +36,8 @@ class Product(BaseModel):
 
 
 class Customer(BaseModel):
+    model_config = HOT_MODEL_CONFIG
+
     name: str
     email: EmailStr
     phone: Optional[str] = None
@@ -45,6 +50,8 @@ class Customer(BaseModel):
 
 
 class CartItem(BaseModel):
+    model_config = HOT_MODEL_CONFIG
+
     product_id: str
     title: str
     price: float
@@ -60,6 +67,8 @@ class Cart(BaseModel):
 
 
 class OrderItem(BaseModel):
+    model_config = HOT_MODEL_CONFIG
+
     product_id: str
     title: str
     price: float